@@ -49,10 +49,12 @@ def main():
     ], cwd=args.input_repo)
     project_data = json.loads(project_data_json.decode('utf8'))
     gen_targets_by_type = collections.defaultdict(list)
-    context = Context(project_data, gen_targets_by_type, args.output_repo)
+    context = Context(
+            project_data, gen_targets_by_type, args.output_repo, set(), set())
     target_generator = TargetGenerator(context)
     for target_name, target_data in project_data.items():
         target_generator.add_sample(target_data)
+    target_generator.freeze()
 
     try:
         os.makedirs(args.output_repo)
@@ -1,8 +1,15 @@
 import collections
+import itertools
 import os
-import random
 
-from artificialproject.random import weighted_choice
+from artificialproject.random import make_sampler, rng
+
+
+_random = rng.random
+_sample = rng.sample
+
+# Creates an empty file, failing if anything already exists at the path.
+_CREATE_FLAGS = os.O_CREAT | os.O_EXCL | os.O_WRONLY
 
 
 class GenerationFailedException(Exception):
@@ -15,30 +22,73 @@ GeneratedField = collections.namedtuple('GeneratedField', [
 ])
 
 
-class NullableGenerator:
+class _FreezableGenerator:
+    """Base class for generators that are trained and then sampled from.
+
+    add_sample() marks the generator dirty and generate() rebuilds its
+    samplers on the next call. Once training is over, freeze() prepares the
+    generator and all of its child generators up front, after which
+    add_sample() may no longer be called.
+    """
+
+    _child_generators = ()
+    _dirty = True
+    _frozen = False
+
+    def freeze(self):
+        for name in self._child_generators:
+            getattr(self, name).freeze()
+        self._prepare()
+        self._frozen = True
+
+    def _invalidate(self):
+        assert not self._frozen, 'Cannot add samples to a frozen generator'
+        self._dirty = True
+
+    def _prepare(self):
+        self._dirty = False
+
+
+class NullableGenerator(_FreezableGenerator):
+    _child_generators = ('_value_generator',)
+
     def __init__(self, value_generator):
         self._value_generator = value_generator
-        self._null_values = collections.Counter()
+        self._null_values = collections.defaultdict(int)
 
     def add_sample(self, base_path, sample):
+        self._invalidate()
         if sample is None:
-            self._null_values.update([True])
+            self._null_values[True] += 1
         else:
-            self._null_values.update([False])
+            self._null_values[False] += 1
             self._value_generator.add_sample(base_path, sample)
 
+    def _prepare(self):
+        total = sum(self._null_values.values())
+        if total:
+            self._null_probability = self._null_values.get(True, 0) / total
+        else:
+            self._null_probability = 0.0
+        self._dirty = False
+
     def generate(self):
-        if weighted_choice(self._null_values):
+        if self._dirty:
+            self._prepare()
+        if _random() < self._null_probability:
             return GeneratedField(None, [])
         else:
             return self._value_generator.generate()
 
 
-class SingletonGenerator:
+class SingletonGenerator(_FreezableGenerator):
+    _child_generators = ('_set_generator',)
+
     def __init__(self, set_generator):
         self._set_generator = set_generator
 
     def add_sample(self, base_path, sample):
+        self._invalidate()
         self._set_generator.add_sample(base_path, [sample])
 
     def generate(self):
@@ -47,132 +97,226 @@ class SingletonGenerator:
         return GeneratedField(field.value[0], field.deps)
 
 
-class StringGenerator:
+class StringGenerator(_FreezableGenerator):
     def __init__(self):
-        self._lengths = collections.Counter()
-        self._first_chars = collections.Counter()
+        self._lengths = collections.defaultdict(int)
+        self._first_chars = collections.defaultdict(int)
         self._other_chars = collections.Counter()
 
     def add_sample(self, base_path, sample):
-        self._lengths.update([len(sample)])
+        self._invalidate()
+        self._lengths[len(sample)] += 1
         if sample:
-            self._first_chars.update(sample[0])
-        for ch in sample[1:]:
-            self._other_chars.update(ch)
+            self._first_chars[sample[0]] += 1
+        self._other_chars.update(sample[1:])
+
+    def _prepare(self):
+        self._lengths_sampler = make_sampler(self._lengths)
+        self._first_chars_sampler = make_sampler(self._first_chars)
+        self._other_chars_sampler = make_sampler(self._other_chars)
+        self._dirty = False
 
     def generate(self):
-        length = weighted_choice(self._lengths)
-        output = ''
-        if length > 0:
-            output += weighted_choice(self._first_chars)
-        while len(output) < length:
-            output += weighted_choice(self._other_chars)
+        if self._dirty:
+            self._prepare()
+        length = self._lengths_sampler.sample()
+        if length == 0:
+            return GeneratedField('', [])
+        # Joining the sampled characters once avoids quadratic concatenation.
+        # Single-character strings are cached, so this also beats filling a
+        # bytearray and decoding it.
+        output = (self._first_chars_sampler.sample() +
+                  ''.join(self._other_chars_sampler.sample_many(length - 1)))
         return GeneratedField(output, [])
 
-
-class BuildTargetSetGenerator:
+    def generate_many(self, count):
+        """Returns the values of count generated strings.
+
+        All characters are drawn in bulk and joined into a single buffer that
+        the strings are sliced from, which is much cheaper than calling
+        generate() count times.
+        """
+        if self._dirty:
+            self._prepare()
+        lengths = self._lengths_sampler.sample_many(count)
+        nonempty_count = count - lengths.count(0)
+        first_chars = iter(
+                self._first_chars_sampler.sample_many(nonempty_count))
+        other_chars = ''.join(self._other_chars_sampler.sample_many(
+                sum(lengths) - nonempty_count))
+        output = []
+        start = 0
+        for length in lengths:
+            if length == 0:
+                output.append('')
+                continue
+            end = start + length - 1
+            output.append(next(first_chars) + other_chars[start:end])
+            start = end
+        return output
+
+
+class BuildTargetSetGenerator(_FreezableGenerator):
     def __init__(self, context):
         self._context = context
-        self._lengths = collections.Counter()
-        self._types = collections.Counter()
+        self._lengths = collections.defaultdict(int)
+        self._types = collections.defaultdict(int)
 
     def add_sample(self, base_path, sample):
-        self._lengths.update([len(sample)])
+        self._invalidate()
+        self._lengths[len(sample)] += 1
+        base_prefix = '//' + base_path
         for target in sample:
-            target = target.split('#')[0]
+            target = target.partition('#')[0]
             if target.startswith(':'):
-                target = '//' + base_path + target
+                target = base_prefix + target
             target_data = self._context.input_target_data[target]
-            self._types.update([target_data['buck.type']])
+            self._types[target_data['buck.type']] += 1
+
+    def _prepare(self):
+        self._lengths_sampler = make_sampler(self._lengths)
+        self._types_sampler = make_sampler(self._types)
+        # gen_targets_by_type is a defaultdict(list) whose lists are only ever
+        # appended to, so holding on to them keeps up with generated targets.
+        self._options_by_type = {
+            type: self._context.gen_targets_by_type[type]
+            for type in self._types
+        }
+        self._dirty = False
 
     def generate(self, force_length=None):
+        if self._dirty:
+            self._prepare()
         if force_length is not None:
             length = force_length
         else:
-            length = weighted_choice(self._lengths)
-        type_counts = collections.Counter()
-        types = collections.Counter(self._types)
-        for i in range(length):
-            type_counts.update([weighted_choice(types)])
+            length = self._lengths_sampler.sample()
+        type_counts = collections.Counter(
+                self._types_sampler.sample_many(length))
         output = []
         for type, count in type_counts.items():
-            options = self._context.gen_targets_by_type[type]
+            options = self._options_by_type[type]
             if count > len(options):
                 raise GenerationFailedException()
-            output.extend(random.sample(options, count))
+            output.extend(_sample(options, count))
         return GeneratedField(output, output)
 
 
-class PathSetGenerator:
+class PathSetGenerator(_FreezableGenerator):
+    _child_generators = ('_component_generator',)
+
     def __init__(self, context):
         self._context = context
+        self._output_repository = context.output_repository
         self._component_generator = StringGenerator()
-        self._lengths = collections.Counter()
-        self._component_counts = collections.Counter()
+        self._lengths = collections.defaultdict(int)
+        self._component_counts = collections.defaultdict(int)
 
     def add_sample(self, base_path, sample):
-        self._lengths.update([len(sample)])
+        self._invalidate()
+        self._lengths[len(sample)] += 1
         for path in sample:
-            components = []
-            while path:
-                path, component = os.path.split(path)
-                components.append(component)
-            self._component_counts.update([len(components)])
+            components = [c for c in path.split(os.sep) if c]
+            self._component_counts[len(components)] += 1
             for component in components:
                 self._component_generator.add_sample(base_path, component)
 
+    def _prepare(self):
+        self._lengths_sampler = make_sampler(self._lengths)
+        self._component_counts_sampler = make_sampler(self._component_counts)
+        self._dirty = False
+
     def generate(self, force_length=None):
+        if self._dirty:
+            self._prepare()
         if force_length is not None:
             length = force_length
         else:
-            length = weighted_choice(self._lengths)
-        output = [self._generate_path() for i in range(length)]
+            length = self._lengths_sampler.sample()
+        output = self._generate_path_strings(length)
+        self._materialize(output)
         return GeneratedField(output, [])
 
-    def _generate_path(self):
-        component_count = weighted_choice(self._component_counts)
-        components = [self._component_generator.generate().value
-                      for i in range(component_count)]
-        path = os.path.join(*components)
-        full_path = os.path.join(self._context.output_repository, path)
-        if os.path.exists(full_path):
+    def _generate_path_strings(self, count):
+        component_counts = self._component_counts_sampler.sample_many(count)
+        components = self._component_generator.generate_many(
+                sum(component_counts))
+        component_ends = itertools.accumulate(component_counts)
+        return [os.sep.join(components[end - component_count:end])
+                for component_count, end in zip(
+                    component_counts, component_ends)]
+
+    def _materialize(self, paths):
+        full_paths = [os.path.join(self._output_repository, path)
+                      for path in paths]
+        created_paths = self._context.created_paths
+        if (len(set(full_paths)) != len(full_paths) or
+                any(full_path in created_paths for full_path in full_paths)):
             raise GenerationFailedException()
+        ensured_dirs = self._context.ensured_dirs
+        parents = set(os.path.dirname(full_path) for full_path in full_paths)
+        created = []
         try:
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        except (NotADirectoryError, FileExistsError):
+            for parent in sorted(parents - ensured_dirs):
+                os.makedirs(parent, exist_ok=True)
+                ensured_dirs.add(parent)
+            for full_path in full_paths:
+                fd = os.open(full_path, _CREATE_FLAGS, 0o666)
+                os.close(fd)
+                created.append(full_path)
+        except (NotADirectoryError, FileExistsError, IsADirectoryError):
+            # Some collisions (say, a path that is already a directory) only
+            # show up on disk, so undo the files this set already created.
+            for full_path in created:
+                os.remove(full_path)
             raise GenerationFailedException()
-        with open(full_path, 'w'):
-            pass
-        return path
+        created_paths.update(created)
+
 
+class SourcePathSetGenerator(_FreezableGenerator):
+    _child_generators = (
+        '_build_target_set_generator',
+        '_path_set_generator',
+    )
 
-class SourcePathSetGenerator:
     def __init__(self, context):
         self._build_target_set_generator = BuildTargetSetGenerator(context)
         self._path_set_generator = PathSetGenerator(context)
-        self._lengths = collections.Counter()
-        self._build_target_values = collections.Counter()
+        self._lengths = collections.defaultdict(int)
+        self._build_target_values = collections.defaultdict(int)
 
     def add_sample(self, base_path, sample):
-        self._lengths.update([len(sample)])
+        self._invalidate()
+        self._lengths[len(sample)] += 1
         for source_path in sample:
             if source_path.startswith('//') or source_path.startswith(':'):
-                self._build_target_values.update([True])
+                self._build_target_values[True] += 1
                 self._build_target_set_generator.add_sample(
                         base_path, [source_path])
             else:
-                self._build_target_values.update([False])
+                self._build_target_values[False] += 1
                 self._path_set_generator.add_sample(base_path, [source_path])
 
+    def _prepare(self):
+        self._lengths_sampler = make_sampler(self._lengths)
+        total = sum(self._build_target_values.values())
+        if total:
+            self._build_target_probability = (
+                    self._build_target_values.get(True, 0) / total)
+        else:
+            self._build_target_probability = 0.0
+        self._dirty = False
+
     def generate(self):
-        length = weighted_choice(self._lengths)
-        build_target_count = 0
-        path_count = 0
-        for i in range(length):
-            if weighted_choice(self._build_target_values):
-                build_target_count += 1
-            else:
-                path_count += 1
+        if self._dirty:
+            self._prepare()
+        length = self._lengths_sampler.sample()
+        # The number of build targets is binomially distributed.
+        probability = self._build_target_probability
+        uniform = _random
+        build_target_count = sum(
+                uniform() < probability for i in range(length))
+        path_count = length - build_target_count
         build_targets = self._build_target_set_generator.generate(
                 force_length=build_target_count)
         paths = self._path_set_generator.generate(force_length=path_count)
@@ -184,13 +328,19 @@ class SourcePathSetGenerator:
                 build_targets.deps + paths.deps)
 
 
-class SourcesWithFlagsGenerator:
+class SourcesWithFlagsGenerator(_FreezableGenerator):
+    _child_generators = (
+        '_source_path_set_generator',
+        '_flag_generator',
+    )
+
     def __init__(self, context):
         self._source_path_set_generator = SourcePathSetGenerator(context)
         self._flag_generator = StringGenerator()
-        self._flag_counts = collections.Counter()
+        self._flag_counts = collections.defaultdict(int)
 
     def add_sample(self, base_path, sample):
+        self._invalidate()
         source_paths = []
         flag_lists = []
         for source_with_flags in sample:
@@ -202,20 +352,25 @@ class SourcesWithFlagsGenerator:
                 flag_lists.append([])
         self._source_path_set_generator.add_sample(base_path, source_paths)
         for flags in flag_lists:
-            self._flag_counts.update([len(flags)])
+            self._flag_counts[len(flags)] += 1
             for flag in flags:
                 self._flag_generator.add_sample(base_path, flag)
 
+    def _prepare(self):
+        self._flag_counts_sampler = make_sampler(self._flag_counts)
+        self._dirty = False
+
     def generate(self):
+        if self._dirty:
+            self._prepare()
         source_paths = self._source_path_set_generator.generate()
-        output = [self._generate_source_with_flags(sp)
-                  for sp in source_paths.value]
+        flag_counts = self._flag_counts_sampler.sample_many(
+                len(source_paths.value))
+        flags = self._flag_generator.generate_many(sum(flag_counts))
+        flag_ends = itertools.accumulate(flag_counts)
+        output = [
+            [source_path, flags[end - count:end]] if count else source_path
+            for source_path, count, end in zip(
+                source_paths.value, flag_counts, flag_ends)
+        ]
         return GeneratedField(output, source_paths.deps)
-
-    def _generate_source_with_flags(self, source_path):
-        flag_count = weighted_choice(self._flag_counts)
-        if flag_count == 0:
-            return source_path
-        flags = [self._flag_generator.generate().value
-                 for i in range(flag_count)]
-        return [source_path, flags]
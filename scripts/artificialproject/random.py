@@ -1,13 +1,158 @@
+import bisect
+import itertools
 import random
 
 
+# All of the generator's randomness comes from this instance, so seeding it is
+# enough to make a run reproducible.
+rng = random.Random()
+_randint = rng.randint
+_random = rng.random
+
+
 def weighted_choice(weight_dict):
     total = sum(weight_dict.values())
     if total == 0:
         return None
-    selected = random.randint(0, total-1)
+    selected = _randint(0, total-1)
     for key, weight in weight_dict.items():
         if selected < weight:
             return key
         selected -= weight
     assert False
+
+
+def _split_weights(weight_dict):
+    """Returns parallel tuples of the keys and weights with nonzero weight."""
+    items = [item for item in weight_dict.items() if item[1] > 0]
+    if not items:
+        return (), ()
+    keys, weights = zip(*items)
+    return keys, weights
+
+
+class AliasSampler:
+    """Draws keys in O(1) using Vose's alias method.
+
+    Takes parallel sequences of keys and their positive weights, as returned
+    by _split_weights. Building the table is O(n), so it only pays off when
+    the same weights are sampled many times. Like weighted_choice, sampling
+    with no keys returns None.
+    """
+
+    def __init__(self, keys, weights):
+        self._keys = keys
+        count = len(weights)
+        probs = [1.0] * count
+        aliases = list(range(count))
+        total = sum(weights)
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            probs[less] = scaled[less]
+            aliases[less] = more
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left over is only off from 1.0 by rounding error, so it
+        # keeps the default probability of 1.0 and never uses its alias.
+        self._probs = tuple(probs)
+        self._aliases = tuple(aliases)
+
+    def sample(self):
+        count = len(self._keys)
+        if count == 0:
+            return None
+        # One uniform draw picks both the bucket and the coin flip.
+        u = _random() * count
+        i = int(u)
+        if u - i < self._probs[i]:
+            return self._keys[i]
+        return self._keys[self._aliases[i]]
+
+    def sample_many(self, count):
+        """Returns a list of count independent samples."""
+        keys = self._keys
+        probs = self._probs
+        aliases = self._aliases
+        key_count = len(keys)
+        if key_count == 0:
+            return [None] * count
+        uniform = _random
+        output = []
+        append = output.append
+        for _ in range(count):
+            u = uniform() * key_count
+            i = int(u)
+            append(keys[i] if u - i < probs[i] else keys[aliases[i]])
+        return output
+
+
+class CumulativeSampler:
+    """Draws keys by bisecting precomputed cumulative weights.
+
+    Takes the same arguments as AliasSampler. Sampling is O(log n), but with a
+    smaller constant than AliasSampler, which makes it the faster choice for
+    the tiny distributions (booleans, short lengths) that most generator
+    fields have.
+    """
+
+    def __init__(self, keys, weights):
+        self._keys = keys
+        self._cumulative_weights = tuple(itertools.accumulate(weights))
+        self._total = sum(weights)
+
+    def sample(self):
+        if not self._keys:
+            return None
+        return self._keys[bisect.bisect_right(
+            self._cumulative_weights, _random() * self._total)]
+
+    def sample_many(self, count):
+        """Returns a list of count independent samples."""
+        keys = self._keys
+        if not keys:
+            return [None] * count
+        cumulative_weights = self._cumulative_weights
+        total = self._total
+        bisect_right = bisect.bisect_right
+        uniform = _random
+        return [keys[bisect_right(cumulative_weights, uniform() * total)]
+                for _ in range(count)]
+
+
+class ConstantSampler:
+    """Sampler for weight dicts with at most one key of nonzero weight.
+
+    Many fields never vary (singleton lengths, flagless sources, fields that
+    are never null), so skipping the random draws entirely is worthwhile.
+    """
+
+    def __init__(self, key):
+        self._key = key
+
+    def sample(self):
+        return self._key
+
+    def sample_many(self, count):
+        """Returns a list of count independent samples."""
+        return [self._key] * count
+
+
+# Above this many keys the O(1) alias method beats bisecting.
+_MAX_CUMULATIVE_SAMPLER_KEYS = 8
+
+
+def make_sampler(weight_dict):
+    """Returns the fastest sampler for a weight dict of this size."""
+    keys, weights = _split_weights(weight_dict)
+    if len(keys) <= 1:
+        return ConstantSampler(keys[0] if keys else None)
+    if len(keys) <= _MAX_CUMULATIVE_SAMPLER_KEYS:
+        return CumulativeSampler(keys, weights)
+    return AliasSampler(keys, weights)
@@ -19,6 +19,8 @@ Context = collections.namedtuple('Context', [
     'input_target_data',
     'gen_targets_by_type',
     'output_repository',
+    'created_paths',
+    'ensured_dirs',
 ])
 
 
@@ -109,6 +111,11 @@ class TargetDataGenerator:
                 continue
             generator.add_sample(base_path, value)
 
+    def freeze(self):
+        for generator in self._generators.values():
+            if generator is not None:
+                generator.freeze()
+
     def generate(self):
         result = {
             'name': self._target_name_generator(),
@@ -147,6 +154,10 @@ class TargetGenerator:
         self._data_generators[type].add_sample(sample)
         self._types.update([type])
 
+    def freeze(self):
+        for data_generator in self._data_generators.values():
+            data_generator.freeze()
+
     def generate(self, force_type=None):
         if force_type is not None:
             type = force_type
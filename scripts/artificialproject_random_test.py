@@ -0,0 +1,75 @@
+import collections
+import unittest
+
+from artificialproject.random import (
+    AliasSampler,
+    ConstantSampler,
+    CumulativeSampler,
+    make_sampler,
+    rng,
+)
+
+
+WEIGHTS = {'a': 1, 'b': 3, 'c': 6}
+MANY_WEIGHTS = dict((i, i % 5) for i in range(20))
+DRAWS = 100000
+
+
+class TestSamplers(unittest.TestCase):
+    def setUp(self):
+        rng.seed(0)
+
+    def assert_frequencies(self, samples, weights):
+        total = sum(weights.values())
+        counts = collections.Counter(samples)
+        self.assertEqual(
+            set(counts),
+            set(key for key, weight in weights.items() if weight > 0))
+        for key, weight in weights.items():
+            self.assertAlmostEqual(
+                counts[key] / len(samples), weight / total, delta=0.01)
+
+    def test_empty_weights_sample_none(self):
+        for weights in [{}, {'a': 0, 'b': 0}]:
+            sampler = make_sampler(weights)
+            self.assertIsNone(sampler.sample())
+            self.assertEqual(sampler.sample_many(3), [None] * 3)
+        for sampler_class in [AliasSampler, CumulativeSampler]:
+            sampler = sampler_class((), ())
+            self.assertIsNone(sampler.sample())
+            self.assertEqual(sampler.sample_many(3), [None] * 3)
+
+    def test_make_sampler_picks_sampler_by_nonzero_keys(self):
+        self.assertIsInstance(make_sampler({'a': 2, 'b': 0}), ConstantSampler)
+        self.assertIsInstance(make_sampler(WEIGHTS), CumulativeSampler)
+        self.assertIsInstance(
+            make_sampler(dict((i, int(i == 0 or i == 1)) for i in range(20))),
+            CumulativeSampler)
+        self.assertIsInstance(make_sampler(MANY_WEIGHTS), AliasSampler)
+
+    def test_zero_weight_keys_are_never_drawn(self):
+        for weights in [{'a': 0, 'b': 1, 'c': 0, 'd': 2}, MANY_WEIGHTS]:
+            sampler = make_sampler(weights)
+            samples = set(sampler.sample_many(DRAWS))
+            self.assertEqual(
+                samples,
+                set(key for key, weight in weights.items() if weight > 0))
+
+    def test_frequencies_match_weights(self):
+        for weights in [WEIGHTS, MANY_WEIGHTS]:
+            keys = tuple(key for key in weights if weights[key] > 0)
+            values = tuple(weights[key] for key in keys)
+            for sampler_class in [AliasSampler, CumulativeSampler]:
+                sampler = sampler_class(keys, values)
+                self.assert_frequencies(sampler.sample_many(DRAWS), weights)
+                self.assert_frequencies(
+                    [sampler.sample() for _ in range(DRAWS)], weights)
+
+    def test_constant_sampler(self):
+        sampler = make_sampler({'a': 5})
+        self.assertEqual(sampler.sample(), 'a')
+        self.assertEqual(sampler.sample_many(3), ['a', 'a', 'a'])
+
+
+if __name__ == '__main__':
+    unittest.main()